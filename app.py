@@ -1,14 +1,22 @@
 # Import necessary Python libraries and modules
-from flask import Flask, request, render_template, flash, redirect, url_for
+from flask import Flask, request, render_template, flash, redirect, url_for, jsonify
 import os  # For working with file paths and directories
-import re  # For cleaning strings (e.g., removing invalid characters)
-import random  # For generating random numbers
+import sys  # For sharing this module with downlod.py when run as a script
+import string  # For the characters allowed in directory and file names
+import threading  # For guarding shared state across request threads
+import fcntl  # For locking the quotation counter file between processes
+import tempfile  # For replacing the quotation counter file atomically
+import math  # For checking that item values are finite
+import multiprocessing  # For starting PDF worker processes
+import functools  # For binding arguments to PDF job callbacks
+from concurrent.futures import ProcessPoolExecutor, wait, ALL_COMPLETED  # For generating PDFs in parallel
+from concurrent.futures.process import BrokenProcessPool  # Raised when a PDF worker process dies
 from datetime import datetime  # For getting the current date
-from PyPDF2 import PdfReader, PdfWriter  # For reading and writing PDF files
+import pikepdf  # For reading, merging and writing PDF files (qpdf-backed)
 from reportlab.lib.pagesizes import A4  # For setting PDF page size
 from reportlab.pdfgen import canvas  # For creating new PDF content
+from reportlab.pdfbase import pdfmetrics  # For measuring text widths
 from reportlab.lib import colors  # For handling colors in PDFs (not used here but imported)
-from io import BytesIO  # For handling in-memory binary data
 import logging  # For logging errors and debug information
 
 # Create a Flask application instance
@@ -28,35 +36,284 @@ app.config['TEMPLATE_DIR'] = os.path.join(os.path.dirname(__file__), 'files')
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Opened template PDF, shared by every request (the template never changes)
+# Loaded on first use and guarded by a lock because pikepdf objects are not thread-safe
+_TEMPLATE_PDF = None
+_TEMPLATE_LOCK = threading.Lock()
+
+# Function to get the cached template PDF
+def get_template_pdf():
+    """
+    Returns the opened QUOTATION.pdf template, opening it only on the first call.
+    Callers must hold _TEMPLATE_LOCK while reading from it.
+    
+    Returns:
+        pikepdf.Pdf: The cached template PDF
+    """
+    global _TEMPLATE_PDF
+    if _TEMPLATE_PDF is None:
+        template_path = os.path.join(app.config['TEMPLATE_DIR'], 'QUOTATION.pdf')
+        _TEMPLATE_PDF = pikepdf.open(template_path)
+    return _TEMPLATE_PDF
+
+# Translation table for safe_name: ASCII letters, digits and '-' are kept,
+# every other character (including non-ASCII ones) maps to '_'
+class _SafeNameTable(dict):
+    def __missing__(self, codepoint):
+        return '_'
+
+_SAFE_NAME_TABLE = _SafeNameTable(
+    (ord(ch), ch) for ch in string.ascii_letters + string.digits + '-'
+)
+
+# Function to clean a name for use in directory and file names
+def safe_name(name):
+    """
+    Replaces every character except ASCII letters, digits and '-' with '_'.
+    Uses str.translate with a precomputed table instead of a regex substitution.
+    
+    Args:
+        name (str): The name to clean (e.g., a representative or client name)
+    
+    Returns:
+        str: The cleaned name (e.g., 'ACME Ltd.' becomes 'ACME_Ltd_')
+    """
+    return name.translate(_SAFE_NAME_TABLE)
+
+# Prefix used for every quotation number (e.g., 'Q-123')
+QUOTATION_PREFIX = 'Q-'
+
+# Function to get the quotation number a PDF file was saved under
+def quotation_number_from_filename(filename):
+    """
+    Extracts the quotation number from a quotation file name.
+    
+    Args:
+        filename (str): A file name like 'Q-123_CLIENT.pdf'
+    
+    Returns:
+        str or None: The quotation number (e.g., 'Q-123'), or None if the name isn't a quotation file
+    """
+    if not (filename.startswith(QUOTATION_PREFIX) and filename.endswith('.pdf')):
+        return None
+    # Strip the prefix and everything from the client name / extension onwards
+    number = filename[len(QUOTATION_PREFIX):-len('.pdf')].split('_', 1)[0]
+    return f"{QUOTATION_PREFIX}{number}" if number.isdigit() else None
+
+# Files (inside the quotations directory) holding the last quotation number used,
+# and the lock file that serialises updates to it between processes
+QUOTATION_COUNTER_FILE = '.counter'
+QUOTATION_COUNTER_LOCK_FILE = '.counter.lock'
+_COUNTER_LOCK = threading.Lock()  # Serialises counter updates between threads of this process
+
+# Function to find the highest quotation number saved on disk
+def _highest_saved_quotation_number(base_dir):
+    """
+    Scans every representative directory for the highest quotation number in use.
+    Always reads the directories directly, so files written by other processes are counted.
+    
+    Args:
+        base_dir (str): The quotations directory
+    
+    Returns:
+        int: The highest quotation number found, or 0 if there are none
+    """
+    highest = 0
+    with os.scandir(base_dir) as rep_dirs:
+        for rep_dir in rep_dirs:
+            if not rep_dir.is_dir():
+                continue
+            with os.scandir(rep_dir.path) as entries:
+                for entry in entries:
+                    quotation_no = quotation_number_from_filename(entry.name)
+                    if quotation_no:
+                        highest = max(highest, int(quotation_no[len(QUOTATION_PREFIX):]))
+    return highest
+
 # Function to generate a unique quotation number
-def generate_quotation_number(output_dir):
+def generate_quotation_number():
     """
     Generates a unique quotation number like 'Q-001', 'Q-002', etc.
-    Checks if the number already exists in the output directory to avoid conflicts.
+    Numbers come from a counter persisted in the quotations directory, so each call
+    is a single read and write of a small file instead of a directory scan.
+    Updates hold an flock on a separate lock file so several worker processes can
+    share the counter, and the new value is written to a temporary file and renamed
+    into place so a crash never leaves the counter empty.
+    If the counter is missing or unreadable, it restarts after the highest quotation number on disk.
+    
+    Returns:
+        str: A unique quotation number (e.g., 'Q-123')
+    """
+    base_dir = app.config['QUOTATIONS_DIR']
+    os.makedirs(base_dir, exist_ok=True)
+    counter_path = os.path.join(base_dir, QUOTATION_COUNTER_FILE)
+    lock_path = os.path.join(base_dir, QUOTATION_COUNTER_LOCK_FILE)
+    
+    with _COUNTER_LOCK, open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the lock file is closed
+        
+        # Read the last number used
+        try:
+            with open(counter_path) as f:
+                content = f.read().strip()
+        except FileNotFoundError:
+            content = ''
+        if content.isdigit():
+            number = int(content)
+        else:
+            # New (or unreadable) counter: continue from the existing quotations
+            number = _highest_saved_quotation_number(base_dir)
+        number += 1
+        
+        # Write the new number atomically
+        fd, tmp_path = tempfile.mkstemp(dir=base_dir, prefix=QUOTATION_COUNTER_FILE + '.')
+        try:
+            with open(fd, 'w') as f:
+                f.write(str(number))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, counter_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    return f"{QUOTATION_PREFIX}{number:03d}"  # Zero-pad to at least 3 digits (e.g., 'Q-007')
+
+# Cache of directory listings: dir_path -> (mtime_ns, {'dirs': [...], 'pdfs': [...]})
+# A directory's mtime changes whenever an entry is added, removed or renamed in it
+_DIR_CACHE = {}
+
+# Function to list a directory, reusing the cached listing while it is unchanged
+def scan_directory(dir_path):
+    """
+    Lists the subdirectories and PDF files of a directory.
+    The listing is cached and only re-read when the directory's mtime changes.
     
     Args:
-        output_dir (str): The directory where the PDF will be saved
+        dir_path (str): The directory to list
     
     Returns:
-        str: A unique quotation number (e.g., 'Q-123')
+        dict or None: {'dirs': [...], 'pdfs': [...]} with entry names, or None if the directory doesn't exist
     """
-    prefix = 'Q-'  # Prefix for the quotation number
-    random_num = str(random.randint(1, 9999)).zfill(3)  # Generate a random 3-digit number (e.g., '123')
-    quotation_no = f"{prefix}{random_num}"  # Combine prefix and number (e.g., 'Q-123')
-    counter = 1  # Counter to avoid duplicate numbers
+    try:
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        _DIR_CACHE.pop(dir_path, None)
+        return None
+    
+    cached = _DIR_CACHE.get(dir_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
     
-    # Check if a file with this quotation number already exists
-    while os.path.exists(os.path.join(output_dir, f"{quotation_no}.pdf")):
-        random_num = str(random.randint(1, 9999) + (counter * 10000)).zfill(3)  # Generate a new number
-        quotation_no = f"{prefix}{random_num}"
-        counter += 1  # Increment counter to try a new number if needed
+    # Re-read the directory; DirEntry caches the file type so no extra stat() per entry
+    listing = {'dirs': [], 'pdfs': []}
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    listing['dirs'].append(entry.name)
+                elif entry.name.endswith('.pdf'):
+                    listing['pdfs'].append(entry.name)
+    except NotADirectoryError:
+        return None
+    _DIR_CACHE[dir_path] = (mtime_ns, listing)
+    return listing
+
+# Function to drop a cached directory listing
+def invalidate_directory_cache(dir_path):
+    """
+    Forgets the cached listing of a directory so the next scan re-reads it.
+    Used after writing a file, in case the filesystem's mtime resolution hides the change.
+    
+    Args:
+        dir_path (str): The directory whose listing changed
+    """
+    _DIR_CACHE.pop(dir_path, None)
+
+# Index of quotation files by number: 'Q-123' -> [(rep_dir, filename), ...]
+# Numbers are only unique per representative, so one number can map to several files.
+# Built on first use and kept up to date as quotations are generated.
+_QNO_INDEX = None
+_QNO_INDEX_LOCK = threading.Lock()
+
+# Function to get the quotation number index, building it on first use
+def get_quotation_index():
+    """
+    Returns the quotation number index, scanning every representative directory the first time.
     
-    return quotation_no
+    Returns:
+        dict: Quotation numbers mapped to lists of (rep_dir, filename) tuples
+    """
+    global _QNO_INDEX
+    with _QNO_INDEX_LOCK:
+        if _QNO_INDEX is None:
+            index = {}
+            base_dir = app.config['QUOTATIONS_DIR']
+            base_listing = scan_directory(base_dir) or {'dirs': []}
+            for dir_name in base_listing['dirs']:
+                dir_listing = scan_directory(os.path.join(base_dir, dir_name)) or {'pdfs': []}
+                for file in dir_listing['pdfs']:
+                    quotation_no = quotation_number_from_filename(file)
+                    if quotation_no:
+                        index.setdefault(quotation_no, []).append((dir_name, file))
+            _QNO_INDEX = index
+        return _QNO_INDEX
+
+# Function to record a newly generated quotation in the index
+def add_to_quotation_index(quotation_no, rep_dir, filename):
+    """
+    Adds a quotation file to the quotation number index.
+    
+    Args:
+        quotation_no (str): The quotation number (e.g., 'Q-123')
+        rep_dir (str): The representative directory the file was saved in
+        filename (str): The file name (e.g., 'Q-123_CLIENT.pdf')
+    """
+    index = get_quotation_index()
+    with _QNO_INDEX_LOCK:
+        entries = index.setdefault(quotation_no, [])
+        if (rep_dir, filename) not in entries:
+            entries.append((rep_dir, filename))
+
+# Function to look up quotation numbers in the index
+def _find_indexed_quotation(search_quotation_no, search_rep):
+    """
+    Looks up files for a quotation number (e.g., 'Q-123') without scanning directories.
+    Longer numbers starting with it (e.g., 'Q-1234') match too, as in a directory search.
+    
+    Args:
+        search_quotation_no (str): The quotation number to look up
+        search_rep (str): Optional representative name to filter directories
+    
+    Returns:
+        list: Matching files in the same format as get_quotation_files results (empty if none)
+    """
+    base_dir = app.config['QUOTATIONS_DIR']
+    search_key = search_quotation_no.upper()
+    index = get_quotation_index()
+    with _QNO_INDEX_LOCK:
+        entries = [entry for key, files in index.items() if key.startswith(search_key) for entry in files]
+    
+    results = []
+    for dir_name, file in entries:
+        if search_rep and search_rep.lower() not in dir_name.lower():
+            continue
+        # Skip files deleted since they were indexed
+        if not os.path.isfile(os.path.join(base_dir, dir_name, file)):
+            continue
+        results.append({
+            'file': file,
+            'url': os.path.join('quotations', dir_name, file)
+        })
+    return results
 
 # Function to search and retrieve quotation PDF files
 def get_quotation_files(search_quotation_no='', search_rep=''):
     """
     Searches for PDF files in the quotations directory based on quotation number or representative name.
+    A search starting with a complete quotation number (e.g., 'Q-123') is answered
+    from the quotation index, including longer numbers such as 'Q-1234'; other
+    searches, or numbers missing from the index, fall back to a directory scan.
     
     Args:
         search_quotation_no (str): Optional quotation number to filter files (e.g., 'Q-123')
@@ -68,16 +325,23 @@ def get_quotation_files(search_quotation_no='', search_rep=''):
     base_dir = app.config['QUOTATIONS_DIR']  # Get the quotations directory
     results = []  # List to store found files
     
+    # Answer quotation number searches from the index
+    search_key = search_quotation_no.upper()
+    if search_key.startswith(QUOTATION_PREFIX) and search_key[len(QUOTATION_PREFIX):].isdigit():
+        results = _find_indexed_quotation(search_quotation_no, search_rep)
+        if results:
+            return {'results': results}
+    
     # Check if the quotations directory exists
-    if not os.path.isdir(base_dir):
+    base_listing = scan_directory(base_dir)
+    if base_listing is None:
         logger.error(f"Quotations directory not found: {base_dir}")
         return {'error': 'No quotations directory found.'}
     
     # Get a list of representative directories, optionally filtered by search_rep
     dirs = [
-        d for d in os.listdir(base_dir)
-        if os.path.isdir(os.path.join(base_dir, d))
-        and (not search_rep or search_rep.lower() in d.lower())
+        d for d in base_listing['dirs']
+        if not search_rep or search_rep.lower() in d.lower()
     ]
     
     # If no directories are found, return an error
@@ -95,7 +359,10 @@ def get_quotation_files(search_quotation_no='', search_rep=''):
     for dir_name in dirs:
         dir_path = os.path.join(base_dir, dir_name)
         # Find PDFs that match the search_quotation_no (case-insensitive)
-        files = [f for f in os.listdir(dir_path) if f.endswith('.pdf') and search_quotation_no.lower() in f.lower()]
+        dir_listing = scan_directory(dir_path)
+        if dir_listing is None:
+            continue  # Directory was removed since the base listing was cached
+        files = [f for f in dir_listing['pdfs'] if search_quotation_no.lower() in f.lower()]
         
         # Add each file to the results list with its relative path
         for file in files:
@@ -118,27 +385,103 @@ def get_quotation_files(search_quotation_no='', search_rep=''):
     
     return {'results': results}
 
+# Font used for all text on the quotation overlay
+_OVERLAY_FONT = 'Helvetica'
+_OVERLAY_FONT_SIZE = 10
+
+# Function to add a left-aligned string to the overlay
+def _draw_string(t, x, y, text):
+    """
+    Adds a left-aligned string to the overlay's text object.
+    
+    Args:
+        t (PDFTextObject): The overlay's single text object
+        x (float): X-coordinate where the text starts
+        y (float): Y-coordinate of the text baseline
+        text (str): Text to draw
+    """
+    t.setTextOrigin(x, y)
+    t.textOut(text)
+
+# Function to add a right-aligned string to the overlay
+def _draw_right_string(t, x, y, text):
+    """
+    Adds a string right-aligned with x to the overlay's text object.
+    
+    Args:
+        t (PDFTextObject): The overlay's single text object
+        x (float): X-coordinate where the text ends
+        y (float): Y-coordinate of the text baseline
+        text (str): Text to draw
+    """
+    width = pdfmetrics.stringWidth(text, _OVERLAY_FONT, _OVERLAY_FONT_SIZE)
+    _draw_string(t, x - width, y, text)
+
+# Overlays with more item rows than this have their content stream compressed
+_COMPRESS_MIN_ITEMS = 30
+
+# Fonts ReportLab falls back to for characters the overlay font can't encode
+_FALLBACK_FONTS = ('Symbol', 'ZapfDingbats')
+
+# ReportLab canvas used only to lay out overlay text: it has no output file and
+# is never saved. It is built once and shared by all requests, since each request
+# only creates its own text object on it. Every font the overlay can use is
+# registered up front so the canvas's font names never change afterwards.
+_LAYOUT_CANVAS = canvas.Canvas(None, pagesize=A4)
+for _font_name in (_OVERLAY_FONT,) + _FALLBACK_FONTS:
+    _LAYOUT_CANVAS.beginText().setFont(_font_name, _OVERLAY_FONT_SIZE)
+
+# Function to build the font resources referenced by the overlay text
+def _overlay_font_resources(overlay_code):
+    """
+    Builds font dictionaries for the fonts the overlay content stream refers to.
+    ReportLab may switch to a fallback font (e.g. ZapfDingbats) for characters
+    the main font can't encode, so only the overall font mapping is fixed.
+    
+    Args:
+        overlay_code (bytes): The overlay's content-stream operators
+    
+    Returns:
+        dict: Resource names (e.g. '/F1') mapped to pikepdf font dictionaries
+    """
+    fonts = {}
+    for font_name, resource_name in _LAYOUT_CANVAS._doc.fontMapping.items():
+        if f"{resource_name} ".encode('latin-1') not in overlay_code:
+            continue  # Font not used by this overlay
+        font = pikepdf.Dictionary(
+            Type=pikepdf.Name.Font,
+            Subtype=pikepdf.Name.Type1,
+            BaseFont=pikepdf.Name('/' + font_name),
+        )
+        # Symbol fonts use their built-in encoding, the rest use WinAnsi like ReportLab
+        if font_name not in _FALLBACK_FONTS:
+            font.Encoding = pikepdf.Name.WinAnsiEncoding
+        fonts[resource_name] = font
+    return fonts
+
 # Function to create a PDF quotation using a template
-def create_quotation_pdf(output_file, quotation_data, template_path):
+def create_quotation_pdf(output_file, quotation_data):
     """
-    Creates a PDF by overlaying quotation data onto a template PDF.
+    Creates a PDF by overlaying quotation data onto the cached template PDF.
     
     Args:
-        output_file (str): Path where the generated PDF will be saved
+        output_file (str or file): Path where the generated PDF will be saved, or a writable binary file (e.g., BytesIO)
         quotation_data (dict): Data to populate the PDF (e.g., quotation_no, client_name, items)
-        template_path (str): Path to the template PDF file
     
     Returns:
         bool or str: True if successful, error message if failed
     """
     try:
-        # Load the template PDF
-        template_pdf = PdfReader(template_path)
-        output_pdf = PdfWriter()
+        # Copy the cached template pages into a new PDF for this quotation
+        output_pdf = pikepdf.Pdf.new()
+        with _TEMPLATE_LOCK:
+            output_pdf.pages.extend(get_template_pdf().pages)
         
-        # Create a new PDF in memory to overlay text
-        packet = BytesIO()
-        c = canvas.Canvas(packet, pagesize=A4)
+        # Lay out the overlay text with ReportLab's shared layout canvas.
+        # All fields go into one text object, so the font is selected once
+        # and the overlay is a single BT ... ET block
+        t = _LAYOUT_CANVAS.beginText()
+        t.setFont(_OVERLAY_FONT, _OVERLAY_FONT_SIZE)
         
         # Define coordinates for placing text on the PDF (in points)
         coordinates = {
@@ -152,58 +495,295 @@ def create_quotation_pdf(output_file, quotation_data, template_path):
             'total': (540, 145.36),            # Bottom-right for total
         }
         
-        # Set the font for text
-        c.setFont("Helvetica", 10)
-        
         # Add quotation details to the PDF (right-aligned for top-right fields)
-        c.drawRightString(coordinates['quotation_no'][0], coordinates['quotation_no'][1], quotation_data['quotation_no'])
-        c.drawRightString(coordinates['date'][0], coordinates['date'][1], quotation_data['date'])
-        c.drawRightString(coordinates['rep'][0], coordinates['rep'][1], quotation_data['rep'])
-        c.drawString(coordinates['client_name'][0], coordinates['client_name'][1], quotation_data['client_name'])
+        _draw_right_string(t, coordinates['quotation_no'][0], coordinates['quotation_no'][1], quotation_data['quotation_no'])
+        _draw_right_string(t, coordinates['date'][0], coordinates['date'][1], quotation_data['date'])
+        _draw_right_string(t, coordinates['rep'][0], coordinates['rep'][1], quotation_data['rep'])
+        _draw_string(t, coordinates['client_name'][0], coordinates['client_name'][1], quotation_data['client_name'])
         
         # Add items table (Quantity, Rate, Amount, VAT)
         y = coordinates['items_start'][1]  # Starting Y-coordinate for items
         row_height = 20  # Height of each row
-        col_widths = [60, 60, 90, 80]  # Widths for Quantity, Rate, Amount, VAT columns
+        # Widths for Quantity, Rate, Amount, VAT columns, matching the template's
+        # Qty / Rate / Total / VAT headings
+        col_widths = [60, 90, 90, 80]
+        
+        # Work out each column's X-coordinate once instead of per row
+        x_qty = coordinates['items_start'][0]
+        x_rate = x_qty + col_widths[0]
+        x_amount = x_rate + col_widths[1]
+        x_vat = x_amount + col_widths[2]
         
         # Draw each item row
         for item in quotation_data['quote_items']:
-            x = coordinates['items_start'][0]  # Starting X-coordinate
-            c.drawString(x, y, str(item['quantity']))  # Quantity
-            x += col_widths[0]
-            c.drawString(x, y, f"{item['rate']:.0f}")  # Rate (no decimals)
-            x += col_widths[2]
-            c.drawString(x, y, f"{item['amount']:.0f}")  # Amount (no decimals)
-            x += col_widths[2]
-            c.drawString(x, y, f"{item['vat']:.0f}")  # VAT (no decimals)
+            _draw_string(t, x_qty, y, str(item['quantity']))  # Quantity
+            _draw_string(t, x_rate, y, f"{item['rate']:.0f}")  # Rate (no decimals)
+            _draw_string(t, x_amount, y, f"{item['amount']:.0f}")  # Amount (no decimals)
+            _draw_string(t, x_vat, y, f"{item['vat']:.0f}")  # VAT (no decimals)
             y -= row_height  # Move up to the next row
         
         # Add totals (right-aligned)
-        c.drawRightString(coordinates['subtotal'][0], coordinates['subtotal'][1], f"KES {quotation_data['subtotal']:.0f}")
-        c.drawRightString(coordinates['tax'][0], coordinates['tax'][1], f"KES {quotation_data['tax']:.0f}")
-        c.drawRightString(coordinates['total'][0], coordinates['total'][1], f"KES {quotation_data['total']:.0f}")
+        _draw_right_string(t, coordinates['subtotal'][0], coordinates['subtotal'][1], f"KES {quotation_data['subtotal']:.0f}")
+        _draw_right_string(t, coordinates['tax'][0], coordinates['tax'][1], f"KES {quotation_data['tax']:.0f}")
+        _draw_right_string(t, coordinates['total'][0], coordinates['total'][1], f"KES {quotation_data['total']:.0f}")
+        
+        # Get the overlay content stream
+        overlay_code = t.getCode().encode('latin-1')
         
-        # Finalize the overlay PDF
-        c.showPage()
-        c.save()
+        # Wrap the overlay in a Form XObject with its own font resources, so the
+        # template page's content and fonts are never rewritten or renamed
+        page = output_pdf.pages[0]
+        overlay_form = pikepdf.Stream(output_pdf, overlay_code)
+        overlay_form.Type = pikepdf.Name.XObject
+        overlay_form.Subtype = pikepdf.Name.Form
+        overlay_form.BBox = page.mediabox
+        overlay_form.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(_overlay_font_resources(overlay_code)))
+        overlay_name = page.add_resource(overlay_form, pikepdf.Name.XObject, prefix='Overlay')
         
-        # Merge the overlay with the template
-        overlay_pdf = PdfReader(packet)
-        for page_num in range(len(template_pdf.pages)):
-            page = template_pdf.pages[page_num]
-            if page_num < len(overlay_pdf.pages):
-                page.merge_page(overlay_pdf.pages[page_num])
-            output_pdf.add_page(page)
+        # Stamp the overlay onto the first template page
+        # The template content is wrapped in q/Q so its graphics state can't leak
+        # into the overlay, then the form is drawn after it
+        page.contents_add(b'q\n', prepend=True)
+        page.contents_add(b'Q\nq ' + str(overlay_name).encode('latin-1') + b' Do Q\n', prepend=False)
         
         # Save the final PDF to the output file
-        with open(output_file, 'wb') as f:
-            output_pdf.write(f)
+        # qpdf keeps the template's already-compressed streams as they are, so this
+        # only decides whether the overlay streams added here get compressed.
+        # Small overlays are left as-is: deflating a few hundred bytes costs more than it saves
+        compress = len(quotation_data['quote_items']) > _COMPRESS_MIN_ITEMS
+        output_pdf.save(output_file, linearize=False, compress_streams=compress)
         
         return True  # Success
     except Exception as e:
         logger.error(f"PDF generation failed: {str(e)}")
         return str(e)  # Return error message if something goes wrong
 
+# Error messages for item rows that can't be used
+INCOMPLETE_ITEM_ERROR = 'Incomplete item data at row {}. Quantity, rate, amount, and VAT are required.'
+INVALID_ITEM_ERROR = 'Invalid item data at row {}. Quantity, rate, amount, and VAT must be finite numbers.'
+
+# Function to convert submitted item rows to numbers and total them
+def parse_quote_items(quantities, rates, amounts, vats):
+    """
+    Converts the submitted item fields to numbers and calculates the subtotal and tax.
+    Rows with an empty quantity, rate or amount are reported as incomplete without
+    being converted, so blank rows don't raise and catch a ValueError each.
+    
+    Args:
+        quantities (list): Quantity strings from the form
+        rates (list): Rate strings from the form
+        amounts (list): Amount strings from the form
+        vats (list): VAT percentage strings from the form (empty means 0)
+    
+    Returns:
+        tuple: (items, subtotal, tax, errors) where items is a list of item dicts
+    """
+    items = []
+    subtotal = 0
+    tax = 0
+    errors = []
+    
+    # Process each item
+    for i in range(len(quantities)):
+        # Skip rows missing a required field
+        if not (quantities[i] and rates[i] and amounts[i]):
+            errors.append(INCOMPLETE_ITEM_ERROR.format(i + 1))
+            continue
+        
+        try:
+            quantity = float(quantities[i])
+            rate = float(rates[i])
+            amount = float(amounts[i])
+            vat = float(vats[i]) if vats[i] else 0
+        except ValueError:
+            errors.append(INCOMPLETE_ITEM_ERROR.format(i + 1))
+            continue
+        
+        if not all(math.isfinite(value) for value in (quantity, rate, amount, vat)):
+            errors.append(INVALID_ITEM_ERROR.format(i + 1))
+            continue
+        
+        # Add valid item to the quotation data
+        if quantity and rate and amount:
+            items.append({
+                'quantity': quantity,
+                'rate': rate,
+                'amount': amount,
+                'vat': vat,
+            })
+            subtotal += amount
+            tax += amount * (vat / 100)
+        else:
+            errors.append(INCOMPLETE_ITEM_ERROR.format(i + 1))
+    
+    return items, subtotal, tax, errors
+
+# Function to create empty quotation data
+def new_quotation_data():
+    """
+    Returns the default quotation data used to populate the form and the PDF.
+    
+    Returns:
+        dict: Quotation data with today's date and no items
+    """
+    return {
+        'quotation_no': '',
+        'date': datetime.now().strftime('%Y-%m-%d'),  # Current date
+        'client_name': '',
+        'rep': '',
+        'quote_items': [],
+        'subtotal': 0,
+        'tax': 0,
+        'total': 0,
+    }
+
+# Function to validate a submitted quotation and choose its output file
+def prepare_quotation(quotation_data, quantities, rates, amounts, vats):
+    """
+    Validates a quotation, fills in its number, items and totals, and works out
+    where its PDF should be saved. quotation_data is updated in place so the
+    form can be repopulated if there are errors.
+    
+    Args:
+        quotation_data (dict): Quotation data with 'client_name' and 'rep' already set
+        quantities (list): Quantity values for each item
+        rates (list): Rate values for each item
+        amounts (list): Amount values for each item
+        vats (list): VAT percentage values for each item (empty means 0)
+    
+    Returns:
+        tuple: (output_file, errors) where errors is a list of error messages
+    """
+    errors = []  # List to store error messages
+    
+    # Create a safe directory name for the representative
+    safe_rep_name = safe_name(quotation_data['rep'])
+    safe_client_name = safe_name(quotation_data['client_name'])
+    output_dir = os.path.join(app.config['QUOTATIONS_DIR'], safe_rep_name)
+    
+    # Create the output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        try:
+            os.makedirs(output_dir, mode=0o777)
+            invalidate_directory_cache(app.config['QUOTATIONS_DIR'])
+        except OSError as e:
+            errors.append(f'Failed to create directory: {output_dir}')
+            logger.error(f"Failed to create directory: {output_dir}, error: {str(e)}")
+    
+    # Initialize the items list
+    quotation_data['quote_items'] = []
+    
+    # Validate that all item fields have the same number of entries
+    if not (len(quantities) == len(rates) == len(amounts) == len(vats)):
+        errors.append('Invalid item data submitted.')
+    else:
+        max_rows_per_page = 6  # Maximum rows per page (for PDF layout)
+        if len(quantities) > max_rows_per_page * 10:
+            errors.append(f'Too many items. Maximum {max_rows_per_page * 10} items allowed.')
+        else:
+            # Convert and total the items
+            items, subtotal, tax, item_errors = parse_quote_items(quantities, rates, amounts, vats)
+            quotation_data['quote_items'] = items
+            quotation_data['subtotal'] = subtotal
+            quotation_data['tax'] = tax
+            errors.extend(item_errors)
+    
+    # Calculate the total
+    quotation_data['total'] = quotation_data['subtotal'] + quotation_data['tax']
+    
+    # Validate required fields
+    if not quotation_data['client_name']:
+        errors.append('Client name is required.')
+    if not quotation_data['rep']:
+        errors.append('Representative name is required.')
+    if not quotation_data['quote_items']:
+        errors.append('At least one complete item is required.')
+    
+    # Check if the template exists and the output directory is writable
+    if not errors:
+        template_path = os.path.join(app.config['TEMPLATE_DIR'], 'QUOTATION.pdf')
+        if not os.path.exists(template_path):
+            errors.append(f'Quotation template not found: {template_path}')
+        elif not os.access(output_dir, os.W_OK):
+            errors.append(f'Output directory is not writable: {output_dir}')
+    
+    # Generate a unique quotation number, only for valid quotations so rejected
+    # submissions don't use up numbers
+    if not errors:
+        try:
+            quotation_data['quotation_no'] = generate_quotation_number()
+        except OSError as e:
+            errors.append('Failed to generate a quotation number.')
+            logger.error(f"Failed to update quotation counter, error: {str(e)}")
+    
+    output_file = os.path.join(output_dir, f"{quotation_data['quotation_no']}_{safe_client_name}.pdf")
+    return output_file, errors
+
+# Function to register a newly saved quotation PDF
+def record_quotation(quotation_data, output_file):
+    """
+    Updates the directory cache and quotation index after a quotation PDF has been saved.
+    
+    Args:
+        quotation_data (dict): The quotation that was generated
+        output_file (str): Path the PDF was saved to
+    """
+    output_dir = os.path.dirname(output_file)
+    invalidate_directory_cache(output_dir)
+    add_to_quotation_index(quotation_data['quotation_no'], os.path.basename(output_dir), os.path.basename(output_file))
+
+# Process pool for generating quotations in parallel (created on first use)
+# Workers are spawned rather than forked so they don't inherit Flask's threads and locks
+_PDF_POOL = None
+_PDF_POOL_LOCK = threading.Lock()
+
+# Function to prepare a PDF worker process
+def _init_pdf_worker(template_dir):
+    """
+    Runs once in each worker process: points it at the template and opens it
+    so every job in that worker reuses the same cached template.
+    
+    Args:
+        template_dir (str): Directory containing QUOTATION.pdf
+    """
+    app.config['TEMPLATE_DIR'] = template_dir
+    with _TEMPLATE_LOCK:
+        get_template_pdf()
+
+# Function to get the PDF process pool, starting it on first use
+def get_pdf_pool():
+    """
+    Returns the process pool used by the bulk endpoint, starting it on the first call.
+    
+    Returns:
+        ProcessPoolExecutor: The shared pool of PDF worker processes
+    """
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_pdf_worker,
+                initargs=(app.config['TEMPLATE_DIR'],),
+            )
+        return _PDF_POOL
+
+# Function to drop a PDF process pool that can no longer run jobs
+def discard_pdf_pool(pool):
+    """
+    Forgets a broken process pool (e.g. a worker was killed), so the next call
+    to get_pdf_pool starts a new one instead of failing every job.
+    
+    Args:
+        pool (ProcessPoolExecutor): The pool that raised BrokenProcessPool
+    """
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is pool:  # Another request may already have replaced it
+            _PDF_POOL = None
+    pool.shutdown(wait=False)
+
 # Define the main route for the application
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -218,36 +798,12 @@ def index():
     success_message = ''  # Message to display on success
     search_errors = []  # List to store search-related errors
     # Initialize default quotation data
-    quotation_data = {
-        'quotation_no': '',
-        'date': datetime.now().strftime('%Y-%m-%d'),  # Current date
-        'client_name': '',
-        'rep': '',
-        'quote_items': [],
-        'subtotal': 0,
-        'tax': 0,
-        'total': 0,
-    }
+    quotation_data = new_quotation_data()
     quotation_files = []  # List to store search results
     # Get search parameters from GET or POST requests
     search_quotation_no = request.args.get('search', '') if request.method == 'GET' else request.form.get('search_quotation_no', '')
     search_rep = request.args.get('search_rep', '') if request.method == 'GET' else request.form.get('search_rep', '')
 
-    # Handle search for quotation files
-    if search_quotation_no or search_rep:
-        quotation_files_data = get_quotation_files(search_quotation_no, search_rep)
-        if 'error' in quotation_files_data:
-            search_errors.append(quotation_files_data['error'])
-        else:
-            quotation_files = quotation_files_data['results']
-    else:
-        # If no search parameters, get all quotation files
-        quotation_files_data = get_quotation_files()
-        if 'error' in quotation_files_data:
-            search_errors.append(quotation_files_data['error'])
-        else:
-            quotation_files = quotation_files_data['results']
-
     # Handle form submission (POST request, not a search)
     if request.method == 'POST' and not (request.form.get('search_quotation_no') or request.form.get('search_rep')):
         # Retain form data for repopulation if there's an error
@@ -260,102 +816,37 @@ def index():
         amounts = request.form.getlist('amount[]')
         vats = request.form.getlist('vat[]')
         
-        # Create a safe directory name for the representative
-        safe_rep_name = re.sub(r'[^A-Za-z0-9\-]', '_', quotation_data['rep'])
-        safe_client_name = re.sub(r'[^A-Za-z0-9\-]', '_', quotation_data['client_name'])
-        output_dir = os.path.join(app.config['QUOTATIONS_DIR'], safe_rep_name)
-        
-        # Create the output directory if it doesn't exist
-        if not os.path.exists(output_dir):
-            try:
-                os.makedirs(output_dir, mode=0o777)
-            except OSError as e:
-                errors.append(f'Failed to create directory: {output_dir}')
-                logger.error(f"Failed to create directory: {output_dir}, error: {str(e)}")
-        
-        # Generate a unique quotation number
-        quotation_data['quotation_no'] = generate_quotation_number(output_dir)
-        
-        # Initialize the items list
-        quotation_data['quote_items'] = []
-        
-        # Validate that all item fields have the same number of entries
-        if not (len(quantities) == len(rates) == len(amounts) == len(vats)):
-            errors.append('Invalid item data submitted.')
-        else:
-            max_rows_per_page = 6  # Maximum rows per page (for PDF layout)
-            if len(quantities) > max_rows_per_page * 10:
-                errors.append(f'Too many items. Maximum {max_rows_per_page * 10} items allowed.')
-            else:
-                # Process each item
-                for i in range(len(quantities)):
-                    try:
-                        quantity = float(quantities[i])
-                        rate = float(rates[i])
-                        amount = float(amounts[i])
-                        vat = float(vats[i]) if vats[i] else 0
-                    except ValueError:
-                        errors.append(f'Incomplete item data at row {i + 1}. Quantity, rate, amount, and VAT are required.')
-                        continue
-                    
-                    # Add valid item to the quotation data
-                    if quantity and rate and amount:
-                        quotation_data['quote_items'].append({
-                            'quantity': quantity,
-                            'rate': rate,
-                            'amount': amount,
-                            'vat': vat,
-                        })
-                        quotation_data['subtotal'] += amount
-                        quotation_data['tax'] += amount * (vat / 100)
-                    else:
-                        errors.append(f'Incomplete item data at row {i + 1}. Quantity, rate, amount, and VAT are required.')
-        
-        # Calculate the total
-        quotation_data['total'] = quotation_data['subtotal'] + quotation_data['tax']
-        
-        # Validate required fields
-        if not quotation_data['client_name']:
-            errors.append('Client name is required.')
-        if not quotation_data['rep']:
-            errors.append('Representative name is required.')
-        if not quotation_data['quote_items']:
-            errors.append('At least one complete item is required.')
+        # Validate the quotation and work out where to save it
+        output_file, errors = prepare_quotation(quotation_data, quantities, rates, amounts, vats)
         
         # Generate the PDF if there are no errors
         if not errors:
             try:
-                output_file = os.path.join(output_dir, f"{quotation_data['quotation_no']}_{safe_client_name}.pdf")
-                template_path = os.path.join(app.config['TEMPLATE_DIR'], 'QUOTATION.pdf')
-                
-                # Check if the template exists and the output directory is writable
-                if not os.path.exists(template_path):
-                    errors.append(f'Quotation template not found: {template_path}')
-                elif not os.access(output_dir, os.W_OK):
-                    errors.append(f'Output directory is not writable: {output_dir}')
+                # Generate the PDF
+                result = create_quotation_pdf(output_file, quotation_data)
+                if result is not True:
+                    errors.append(f'PDF generation failed: {result}')
                 else:
-                    # Generate the PDF
-                    result = create_quotation_pdf(output_file, quotation_data, template_path)
-                    if result is not True:
-                        errors.append(f'PDF generation failed: {result}')
-                    else:
-                        success = True
-                        success_message = f'Quotation generated successfully: {os.path.basename(output_file)}'
-                        flash(success_message, 'success')
-                        
-                        # Refresh the quotation files list
-                        quotation_files_data = get_quotation_files()
-                        if 'error' in quotation_files_data:
-                            search_errors.append(quotation_files_data['error'])
-                        else:
-                            quotation_files = quotation_files_data['results']
-                        
-                        # Redirect to the index page to show the updated list
-                        return redirect(url_for('index'))
+                    record_quotation(quotation_data, output_file)
+                    success = True
+                    success_message = f'Quotation generated successfully: {os.path.basename(output_file)}'
+                    flash(success_message, 'success')
+                    
+                    # Redirect to the index page, which lists the new quotation
+                    return redirect(url_for('index'))
             except Exception as e:
                 errors.append(f'PDF generation failed: {str(e)}')
                 logger.error(f"PDF generation failed: {str(e)}")
     
+    # Handle search for quotation files (all files if no search parameters)
+    # Done only when the page is rendered, so a successful submission, which
+    # redirects, never lists the directories
+    quotation_files_data = get_quotation_files(search_quotation_no, search_rep)
+    if 'error' in quotation_files_data:
+        search_errors.append(quotation_files_data['error'])
+    else:
+        quotation_files = quotation_files_data['results']
+    
     # Render the index.html template with all data
     return render_template('index.html', 
                          quotation_data=quotation_data,
@@ -367,6 +858,170 @@ def index():
                          search_quotation_no=search_quotation_no,
                          search_rep=search_rep)
 
+# Limits for the bulk endpoint
+MAX_BULK_QUOTATIONS = 50  # Maximum quotations per request
+BULK_TIMEOUT_SECONDS = 60  # How long to wait for the PDFs of one request
+
+# Item fields accepted by the bulk endpoint
+_BULK_ITEM_FIELDS = ('quantity', 'rate', 'amount', 'vat')
+
+# Function to check one item of a bulk quotation
+def _is_valid_bulk_item(item):
+    """
+    Checks that a bulk item is an object whose fields are plain numbers, strings or null.
+    JSON integers too large for a float are rejected, since converting them raises OverflowError.
+    
+    Args:
+        item: One entry of a quotation's 'items' list
+    
+    Returns:
+        bool: True if the item can be passed to prepare_quotation
+    """
+    if not isinstance(item, dict):
+        return False
+    for field in _BULK_ITEM_FIELDS:
+        value = item.get(field)
+        if isinstance(value, bool) or not (value is None or isinstance(value, (str, int, float))):
+            return False
+        if isinstance(value, int):
+            try:
+                float(value)
+            except OverflowError:
+                return False
+    return True
+
+# Function to read one field of a bulk item
+def _bulk_item_value(item, field):
+    """
+    Returns an item field as prepare_quotation expects it, with missing or null values as ''.
+    
+    Args:
+        item (dict): A validated bulk item
+        field (str): The field name (e.g., 'quantity')
+    
+    Returns:
+        str, int or float: The field value
+    """
+    value = item.get(field)
+    return '' if value is None else value
+
+# Function to register a bulk PDF that finished after its request stopped waiting
+def _record_late_quotation(quotation_data, output_file, future):
+    """
+    Done callback for timed-out bulk jobs that were already running. The worker
+    still saves the PDF, so it is recorded here once it has been written.
+    
+    Args:
+        quotation_data (dict): The quotation being generated
+        output_file (str): Path the PDF is saved to
+        future (Future): The finished job
+    """
+    if future.cancelled() or future.exception() is not None or future.result() is not True:
+        return
+    record_quotation(quotation_data, output_file)
+    logger.info(f"PDF generated after its bulk request timed out: {output_file}")
+
+# Define the route for generating several quotations at once
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    """
+    Generates several quotations in parallel from a JSON list. Each entry looks like
+    {"client_name": "...", "rep": "...", "items": [{"quantity": 1, "rate": 10, "amount": 10, "vat": 16}]}
+    
+    Returns:
+        JSON with one result per entry: {'file': ...} on success or {'errors': [...]} on failure
+    """
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list):
+        return jsonify({'error': 'Expected a JSON list of quotations.'}), 400
+    if len(entries) > MAX_BULK_QUOTATIONS:
+        return jsonify({'error': f'Too many quotations. Maximum {MAX_BULK_QUOTATIONS} per request.'}), 400
+    
+    results = [None] * len(entries)  # One result per entry, in request order
+    pending = []  # (entry index, quotation data, output file) for entries that passed validation
+    
+    # Validate every entry before starting any PDF generation
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results[i] = {'errors': ['Invalid quotation data submitted.']}
+            continue
+        
+        quotation_data = new_quotation_data()
+        quotation_data['client_name'] = str(entry.get('client_name') or '')
+        quotation_data['rep'] = str(entry.get('rep') or '')
+        items = entry.get('items')
+        if not isinstance(items, list) or not all(_is_valid_bulk_item(item) for item in items):
+            results[i] = {'errors': ['Invalid item data submitted.']}
+            continue
+        
+        output_file, errors = prepare_quotation(
+            quotation_data,
+            [_bulk_item_value(item, 'quantity') for item in items],
+            [_bulk_item_value(item, 'rate') for item in items],
+            [_bulk_item_value(item, 'amount') for item in items],
+            [_bulk_item_value(item, 'vat') for item in items],
+        )
+        if errors:
+            results[i] = {'errors': errors}
+            continue
+        pending.append((i, quotation_data, output_file))
+    
+    # Submit the valid entries to the pool (only started if there is work for it)
+    jobs = {}  # Future -> (entry index, quotation data, output file, pool)
+    if pending:
+        pool = get_pdf_pool()
+        for i, quotation_data, output_file in pending:
+            try:
+                future = pool.submit(create_quotation_pdf, output_file, quotation_data)
+            except BrokenProcessPool:
+                # The pool broke since it was last used: start a new one and retry
+                discard_pdf_pool(pool)
+                pool = get_pdf_pool()
+                try:
+                    future = pool.submit(create_quotation_pdf, output_file, quotation_data)
+                except BrokenProcessPool as e:
+                    discard_pdf_pool(pool)
+                    logger.error(f"PDF generation failed: {str(e)}")
+                    results[i] = {'errors': ['PDF generation failed: worker processes are unavailable.']}
+                    continue
+            jobs[future] = (i, quotation_data, output_file, pool)
+    
+    # Collect the generated PDFs, giving up on any that take too long
+    done, not_done = wait(jobs, timeout=BULK_TIMEOUT_SECONDS, return_when=ALL_COMPLETED)
+    for future, (i, quotation_data, output_file, pool) in jobs.items():
+        if future in not_done:
+            logger.error(f"PDF generation timed out: {output_file}")
+            if future.cancel():
+                results[i] = {'errors': ['PDF generation timed out.']}
+            else:
+                # Running jobs can't be cancelled: record the PDF if the worker still saves it
+                future.add_done_callback(functools.partial(_record_late_quotation, quotation_data, output_file))
+                results[i] = {'errors': [f'PDF generation timed out. The quotation may still be saved as {os.path.basename(output_file)}.']}
+            continue
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed or out of memory), so the pool can't run more jobs
+            discard_pdf_pool(pool)
+            result = 'a worker process stopped unexpectedly.'
+            logger.error(f"PDF generation failed: {str(e)}")
+        except Exception as e:
+            result = str(e)
+            logger.error(f"PDF generation failed: {str(e)}")
+        if result is not True:
+            results[i] = {'errors': [f'PDF generation failed: {result}']}
+        else:
+            record_quotation(quotation_data, output_file)
+            results[i] = {'file': os.path.basename(output_file)}
+    
+    return jsonify({'results': results})
+
+# Register the download routes defined in downlod.py
+# When run as a script this module is '__main__', so it is also registered as 'app'
+# to make downlod.py's 'from app import ...' use this module instead of a second copy
+sys.modules.setdefault('app', sys.modules[__name__])
+import downlod  # noqa: E402,F401
+
 # Run the Flask application
 if __name__ == '__main__':
     app.run(debug=True)  # Run in debug mode for development
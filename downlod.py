@@ -1,7 +1,12 @@
-from flask import send_file, abort
+from flask import request, send_file, abort
+from io import BytesIO
+from pathlib import Path
 import os
 
-from app import app
+from app import app, logger, new_quotation_data, prepare_quotation, create_quotation_pdf, record_quotation
+
+# Prefix get_quotation_files puts in front of every file URL
+QUOTATIONS_URL_PREFIX = 'quotations/'
 
 @app.route('/download')
 def download_file():
@@ -9,8 +14,48 @@ def download_file():
     if not file_path:
         abort(400, description="No file specified")
     
-    full_path = os.path.join(app.config['QUOTATIONS_DIR'], file_path)
-    if not os.path.exists(full_path):
+    # Listed files link to 'quotations/<rep>/<file>', relative to the app root
+    if file_path.startswith(QUOTATIONS_URL_PREFIX):
+        file_path = file_path[len(QUOTATIONS_URL_PREFIX):]
+    
+    # Resolve the path and make sure it stays inside the quotations directory
+    base = Path(app.config['QUOTATIONS_DIR']).resolve()
+    target = (base / file_path).resolve()
+    if not target.is_relative_to(base) or not target.is_file():
         abort(404, description="File not found")
     
-    return send_file(full_path, as_attachment=True)
\ No newline at end of file
+    return send_file(target, as_attachment=True, conditional=True, etag=True)
+
+@app.route('/download/new', methods=['POST'])
+def generate_and_stream_pdf():
+    """Generates a quotation from the submitted form and sends it straight from memory."""
+    quotation_data = new_quotation_data()
+    quotation_data['client_name'] = request.form.get('client_name', '')
+    quotation_data['rep'] = request.form.get('rep', '')
+    output_file, errors = prepare_quotation(
+        quotation_data,
+        request.form.getlist('quantity[]'),
+        request.form.getlist('rate[]'),
+        request.form.getlist('amount[]'),
+        request.form.getlist('vat[]'),
+    )
+    if errors:
+        abort(400, description=' '.join(errors))
+    
+    buf = BytesIO()
+    result = create_quotation_pdf(buf, quotation_data)
+    if result is not True:
+        abort(500, description=f"PDF generation failed: {result}")
+    
+    # Keep a copy on disk for the quotations list, written from memory so the
+    # response never has to read the file back
+    try:
+        with open(output_file, 'wb') as f:
+            f.write(buf.getbuffer())
+    except OSError as e:
+        logger.error(f"PDF generation failed: {str(e)}")
+        abort(500, description=f"PDF generation failed: {e}")
+    record_quotation(quotation_data, output_file)
+    
+    buf.seek(0)
+    return send_file(buf, as_attachment=True, download_name=os.path.basename(output_file), mimetype='application/pdf')